@@ -1,6 +1,40 @@
 import streamlit as st
 import pandas as pd
-from utils import read_file, merge_dataframes, get_download_buffer
+import io
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, Optional, Callable
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from utils import read_file, read_columns, merge_dataframes, get_download_buffer
+
+MAX_READ_WORKERS = 8
+
+def _parallel_map(func: Callable, items: List) -> List:
+    """Run func over items on worker threads that inherit this run's context so the cache works inside them."""
+    with ThreadPoolExecutor(
+        max_workers=min(MAX_READ_WORKERS, len(items)),
+        initializer=add_script_run_ctx,
+        initargs=(None, get_script_run_ctx())
+    ) as executor:
+        return list(executor.map(func, items))
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _read_columns(name: str, data: bytes) -> List:
+    """Read the header of an uploaded file once per distinct file content."""
+    buffer = io.BytesIO(data)
+    buffer.name = name
+    return read_columns(buffer)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _read_bytes(name: str, data: bytes, usecols: Optional[Tuple] = None) -> pd.DataFrame:
+    """Parse an uploaded file once per distinct file content and column projection."""
+    buffer = io.BytesIO(data)
+    buffer.name = name
+    return read_file(buffer, usecols)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _merge_cached(file_ids: Tuple[str, ...], _load_dfs: Callable[[], List[pd.DataFrame]], merge_columns: Dict[str, str], selected_columns: Dict[str, Tuple[str, ...]], df_names: List[str], merge_type: str, compute_stats: bool) -> Tuple[pd.DataFrame, Dict]:
+    """Merge the uploaded DataFrames, reusing the result while the inputs are unchanged."""
+    return merge_dataframes(_load_dfs(), merge_columns, {key: set(cols) for key, cols in selected_columns.items()}, df_names, merge_type, compute_stats)
 
 def main():
     st.set_page_config(
@@ -31,16 +65,24 @@ def main():
         st.warning("⚠️ Please upload at least two files to merge")
         st.stop()
 
-    # Read and store DataFrames with progress
-    dfs = []
-    df_names = []
+    # Only the headers are read up front; the data is parsed once the columns are chosen
+    df_names = [file.name for file in uploaded_files]
     with st.spinner("Processing uploaded files..."):
         try:
-            for file in uploaded_files:
-                df = read_file(file)
-                dfs.append(df)
-                df_names.append(file.name)
-                st.success(f"✅ Successfully loaded: {file.name} ({len(df)} rows, {len(df.columns)} columns)")
+            # Column lists only change with the file, so keep them across reruns
+            schemas = {
+                file.file_id: st.session_state.get("file_schemas", {}).get(file.file_id)
+                for file in uploaded_files
+            }
+            unread = [file for file in uploaded_files if schemas[file.file_id] is None]
+            if unread:
+                columns = _parallel_map(lambda file: _read_columns(file.name, file.getvalue()), unread)
+                schemas.update((file.file_id, cols) for file, cols in zip(unread, columns))
+            st.session_state["file_schemas"] = schemas
+
+            file_columns = [schemas[file.file_id] for file in uploaded_files]
+            for name, columns in zip(df_names, file_columns):
+                st.success(f"✅ Successfully loaded: {name} ({len(columns)} columns)")
         except ValueError as e:
             st.error(f"❌ Error: {str(e)}")
             st.stop()
@@ -55,10 +97,9 @@ def main():
     tabs = st.tabs([f"📄 {name}" for name in df_names])
 
     # Display column selection for each DataFrame
-    for i, (df, tab, name) in enumerate(zip(dfs, tabs, df_names)):
+    for i, (all_cols, tab, name) in enumerate(zip(file_columns, tabs, df_names)):
         with tab:
             st.caption(f"Select columns from {name}")
-            all_cols = df.columns.tolist()
 
             # Add select/deselect all buttons
             col1, col2 = st.columns([1, 5])
@@ -87,19 +128,19 @@ def main():
     merge_columns = {}
 
     # Create columns for each DataFrame
-    cols = st.columns(len(dfs))
+    cols = st.columns(len(uploaded_files))
 
     # Display column selection for each DataFrame
-    for i, (df, col, name) in enumerate(zip(dfs, cols, df_names)):
+    for i, (all_cols, col, name) in enumerate(zip(file_columns, cols, df_names)):
         with col:
             st.subheader(f"📄 {name}")
             merge_columns[f"df{i}"] = st.selectbox(
                 f"Select merge column",
-                options=df.columns.tolist(),
+                options=all_cols,
                 key=f"merge_col_{i}",
                 help=f"Choose the column from {name} to use for merging"
             )
-            st.caption(f"Total columns: {len(df.columns)}")
+            st.caption(f"Total columns: {len(all_cols)}")
 
     # Merge settings
     st.header("4. Merge Settings")
@@ -113,61 +154,107 @@ def main():
         - Right: Keep all rows from the second file
         """
     )
+    show_match_stats = st.checkbox(
+        "Show row-matching stats",
+        value=False,
+        help="Count new and missing keys for each file (adds an extra pass over the merge columns)"
+    )
 
     # Merge preview section with progress tracking
     st.header("5. Preview Merged Data")
 
+    # Files are keyed by upload id so the DataFrames themselves never need hashing
+    file_ids = tuple(file.file_id for file in uploaded_files)
+    merge_settings = (
+        merge_columns,
+        {key: tuple(sorted(cols, key=str)) for key, cols in selected_columns.items()},
+        df_names,
+        merge_type,
+        show_match_stats
+    )
+
     if st.button("🔄 Generate Preview", help="Click to preview the merged data"):
+        st.session_state.pop("merge_result", None)
         with st.spinner("Merging files..."):
             try:
-                merged_df, merge_stats = merge_dataframes(dfs, merge_columns, selected_columns, df_names, merge_type)
-                st.write("Preview of merged data (first 5 rows):")
-                st.dataframe(merged_df.head(), use_container_width=True)
-
-                # Display merge statistics
-                st.subheader("📊 Merge Statistics")
-                cols = st.columns(3)
-                with cols[0]:
-                    st.metric("📈 Total Rows in Original Files", 
-                            f"{merge_stats['total_rows_original']:,}")
-                with cols[1]:
-                    st.metric("📊 Rows After Merge", 
-                            f"{merge_stats['total_rows_merged']:,}")
-                with cols[2]:
-                    st.metric("📑 Files Merged", len(dfs))
-
-                # Display new/missing rows statistics
-                st.subheader("🔄 Row Matching Statistics")
-                for i in range(1, len(dfs)):
-                    st.info(f"""
-                    File {i+1} ({df_names[i]}):
-                    - New rows: {merge_stats['new_rows_per_file'][i]:,}
-                    - Missing rows: {merge_stats['missing_rows_per_file'][i]:,}
-                    """)
-
-                # Download section with format options
-                st.header("6. Download Merged File")
-                download_format = st.radio(
-                    "Select download format:",
-                    options=['csv', 'xlsx'],
-                    horizontal=True,
-                    help="Choose the format for your merged file"
-                )
-
-                buffer, mime = get_download_buffer(merged_df, download_format)
-
-                st.download_button(
-                    label="⬇️ Download merged file",
-                    data=buffer,
-                    file_name=f"merged_data.{download_format}",
-                    mime=mime,
-                    help="Click to download the merged file"
-                )
+                # Parse only the columns that take part in the merge, in file order
+                usecols = [
+                    tuple(col for col in all_cols if col in selected_columns[f"df{i}"] or col == merge_columns[f"df{i}"])
+                    for i, all_cols in enumerate(file_columns)
+                ]
+                def load_dfs():
+                    return _parallel_map(
+                        lambda job: _read_bytes(job[0].name, job[0].getvalue(), job[1]),
+                        list(zip(uploaded_files, usecols))
+                    )
 
+                merged_df, merge_stats = _merge_cached(file_ids, load_dfs, *merge_settings)
+                # Keep the result so later reruns (e.g. picking a download format) don't merge again
+                st.session_state["merge_result"] = (file_ids, merge_settings, merged_df, merge_stats)
             except ValueError as e:
                 st.error(f"❌ Merge Error: {str(e)}")
             except Exception as e:
                 st.error(f"❌ An unexpected error occurred: {str(e)}")
 
+    merge_result = st.session_state.get("merge_result")
+    if merge_result is None or merge_result[0] != file_ids:
+        st.stop()
+
+    _, preview_settings, merged_df, merge_stats = merge_result
+    if preview_settings != merge_settings:
+        st.caption("⚠️ Settings changed since this preview was generated. Click Generate Preview to refresh it.")
+
+    # Only the preview rows are sent to the browser
+    st.write("Preview of merged data (first 5 rows):")
+    st.dataframe(merged_df.head(), use_container_width=True)
+
+    # Display merge statistics
+    st.subheader("📊 Merge Statistics")
+    cols = st.columns(3)
+    with cols[0]:
+        st.metric("📈 Total Rows in Original Files", 
+                f"{merge_stats['total_rows_original']:,}")
+    with cols[1]:
+        st.metric("📊 Rows After Merge", 
+                f"{merge_stats['total_rows_merged']:,}")
+    with cols[2]:
+        st.metric("📑 Files Merged", len(df_names))
+
+    # Display new/missing rows statistics
+    if merge_stats['new_rows_per_file']:
+        st.subheader("🔄 Row Matching Statistics")
+        for i in range(1, len(df_names)):
+            st.info(f"""
+            File {i+1} ({df_names[i]}):
+            - New rows: {merge_stats['new_rows_per_file'][i]:,}
+            - Missing rows: {merge_stats['missing_rows_per_file'][i]:,}
+            """)
+
+    # Download section with format options
+    st.header("6. Download Merged File")
+    download_format = st.radio(
+        "Select download format:",
+        options=['csv', 'xlsx', 'parquet', 'feather'],
+        horizontal=True,
+        help="Choose the format for your merged file (Parquet and Feather are smallest and fastest to write)"
+    )
+
+    # Writing the full file is deferred until it is actually requested
+    if st.button("📦 Prepare download", help="Write the merged data in the selected format"):
+        with st.spinner("Preparing download..."):
+            try:
+                buffer, mime = get_download_buffer(merged_df, download_format)
+            except ValueError as e:
+                st.error(f"❌ Download Error: {str(e)}")
+                st.stop()
+
+        st.download_button(
+            label="⬇️ Download merged file",
+            data=buffer,
+            file_name=f"merged_data.{download_format}",
+            mime=mime,
+            help="Click to download the merged file"
+        )
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
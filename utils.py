@@ -1,24 +1,278 @@
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Tuple, Set
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import xlsxwriter
+from typing import List, Dict, Tuple, Set, Union, Optional, Sequence
 import io
+import gc
+import os
+import sys
+from itertools import islice
 
-def read_file(uploaded_file) -> pd.DataFrame:
-    """Read uploaded Excel/CSV file into pandas DataFrame."""
+# Column projections and renames below rely on copy-on-write views instead of defensive copies
+pd.set_option("mode.copy_on_write", True)
+
+try:
+    import python_calamine  # noqa: F401
+    HAS_CALAMINE = True
+except ImportError:
+    HAS_CALAMINE = False
+
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# Below this many keys the JIT warm-up costs more than the Arrow kernels it replaces
+NUMBA_MIN_KEYS = 1_000_000
+
+if HAS_NUMBA:
+    @njit(parallel=True, cache=True)
+    def _count_code_differences(left_codes, right_codes, n_codes):
+        """Count codes only on the right, only on the left and on both sides in one parallel pass."""
+        in_left = np.zeros(n_codes, dtype=np.bool_)
+        in_right = np.zeros(n_codes, dtype=np.bool_)
+        for i in prange(left_codes.shape[0]):
+            in_left[left_codes[i]] = True
+        for i in prange(right_codes.shape[0]):
+            in_right[right_codes[i]] = True
+
+        new_rows = 0
+        missing_rows = 0
+        shared_keys = 0
+        for code in prange(n_codes):
+            if in_left[code] and in_right[code]:
+                shared_keys += 1
+            elif in_left[code]:
+                missing_rows += 1
+            elif in_right[code]:
+                new_rows += 1
+        return new_rows, missing_rows, shared_keys
+
+def read_csv_header(uploaded_file) -> List:
+    """Read the column names of a CSV file, de-duplicated and filled in the way pandas names them."""
+    columns = pd.read_csv(uploaded_file, nrows=0).columns.tolist()
+    uploaded_file.seek(0)
+    return columns
+
+def read_csv(uploaded_file, usecols: Optional[Sequence] = None) -> pd.DataFrame:
+    """Read a CSV file into an Arrow table and wrap it without copying."""
+    names = read_csv_header(uploaded_file)
+    # The header cells as written; pyarrow names its columns (and matches include_columns) by these
+    raw_names = pd.read_csv(uploaded_file, header=None, nrows=1, dtype=str, keep_default_na=False).iloc[0].tolist()
+    uploaded_file.seek(0)
+
+    wanted = None if usecols is None else set(usecols)
+    positions = [i for i, name in enumerate(names) if wanted is None or name in wanted]
+    include_columns = [raw_names[i] for i in positions] if wanted is not None else []
+    if any(raw_names.count(name) > 1 for name in include_columns):
+        # Repeated header cells cannot be told apart by name, so read them all and pick by position
+        include_columns = []
+
+    convert_options = pacsv.ConvertOptions(strings_can_be_null=True, include_columns=include_columns)
+    try:
+        table = pacsv.read_csv(uploaded_file, convert_options=convert_options)
+        if not include_columns:
+            table = table.select(positions)
+        # pyarrow keeps duplicate and blank headers as they are, so the names come from pandas
+        table = table.rename_columns([names[i] for i in positions])
+    except pa.ArrowInvalid:
+        # pyarrow rejects rows with missing fields, which pandas pads with nulls
+        uploaded_file.seek(0)
+        return pd.read_csv(uploaded_file, usecols=usecols, dtype_backend="pyarrow")
+    return table.to_pandas(types_mapper=pd.ArrowDtype, split_blocks=True, self_destruct=True)
+
+def pandas_column_names(header: Sequence) -> List:
+    """Name header cells the way pandas does: blanks become "Unnamed: N" and repeats get ".1", ".2" suffixes."""
+    names = [f"Unnamed: {i}" if cell is None or cell == "" else cell for i, cell in enumerate(header)]
+    # Suffixes already used by another header cell are skipped
+    taken = set(names)
+    counts: Dict = {}
+    for i, name in enumerate(names):
+        base, count = name, counts.get(name, 0)
+        while count > 0:
+            counts[base] = count + 1
+            name = f"{base}.{count}"
+            count = count + 1 if name in taken else counts.get(name, 0)
+        names[i] = name
+        counts[name] = count + 1
+    return names
+
+def read_excel(uploaded_file, usecols: Optional[Sequence] = None, nrows: Optional[int] = None) -> pd.DataFrame:
+    """Read the first sheet of an Excel file, preferring the calamine engine."""
+    # Match columns by name; a list of ints would be taken as positions by pandas
+    wanted = None if usecols is None else set(usecols)
+    usecols_filter = None if wanted is None else (lambda col: col in wanted)
+    if HAS_CALAMINE:
+        return pd.read_excel(uploaded_file, engine="calamine", dtype_backend="pyarrow", usecols=usecols_filter, nrows=nrows)
+    if not uploaded_file.name.endswith('.xlsx'):
+        # openpyxl cannot open legacy .xls workbooks
+        return pd.read_excel(uploaded_file, dtype_backend="pyarrow", usecols=usecols_filter, nrows=nrows)
+
+    # Stream rows through openpyxl's read-only reader instead of building the cell graph
+    import openpyxl
+    workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = pandas_column_names(next(rows, ()))
+        positions = [i for i, col in enumerate(header) if wanted is None or col in wanted]
+        # Trailing empty cells may be missing from a row, so those are padded with None
+        records = (tuple(row[i] if i < len(row) else None for i in positions) for row in islice(rows, nrows))
+        df = pd.DataFrame.from_records(records, columns=[header[i] for i in positions])
+        return df.convert_dtypes(dtype_backend="pyarrow")
+    finally:
+        workbook.close()
+
+def read_excel_header(uploaded_file) -> List:
+    """Read the column names of the first sheet of an Excel file, named the way pandas names them."""
+    if not uploaded_file.name.endswith('.xlsx'):
+        # openpyxl cannot open legacy .xls workbooks, which are capped at 65,536 rows anyway
+        return read_excel(uploaded_file, nrows=0).columns.tolist()
+
+    # calamine loads the whole sheet even for nrows=0; the read-only reader stops after the first row
+    import openpyxl
+    workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        header = next(workbook.worksheets[0].iter_rows(max_row=1, values_only=True), ())
+    finally:
+        workbook.close()
+    uploaded_file.seek(0)
+    return pandas_column_names(header)
+
+def read_columns(uploaded_file) -> List:
+    """Read only the column names of an uploaded Excel/CSV file."""
     try:
         if uploaded_file.name.endswith('.csv'):
-            return pd.read_csv(uploaded_file)
+            return read_csv_header(uploaded_file)
         elif uploaded_file.name.endswith(('.xls', '.xlsx')):
-            return pd.read_excel(uploaded_file)
+            return read_excel_header(uploaded_file)
         else:
             raise ValueError("Unsupported file format")
     except Exception as e:
         raise ValueError(f"Error reading file: {str(e)}")
 
-def merge_dataframes(dfs: List[pd.DataFrame], merge_columns: Dict[str, str], selected_columns: Dict[str, Set[str]], df_names: List[str], merge_type: str = 'outer') -> Tuple[pd.DataFrame, Dict]:
+def read_file(uploaded_file, usecols: Optional[Sequence] = None) -> pd.DataFrame:
+    """Read uploaded Excel/CSV file into pandas DataFrame, optionally only the named columns."""
+    try:
+        if uploaded_file.name.endswith('.csv'):
+            return read_csv(uploaded_file, usecols)
+        elif uploaded_file.name.endswith(('.xls', '.xlsx')):
+            return read_excel(uploaded_file, usecols)
+        else:
+            raise ValueError("Unsupported file format")
+    except Exception as e:
+        raise ValueError(f"Error reading file: {str(e)}")
+
+STRING_KEY_DTYPE = pd.ArrowDtype(pa.string())
+
+# Merge keys travel as a frame's index during the join, but the helpers also accept plain columns
+Keys = Union[pd.Series, pd.Index]
+
+def is_null_keys(keys: Keys) -> bool:
+    """Check whether a key column has Arrow's null type, as read from an empty or all-blank column."""
+    return isinstance(keys.dtype, pd.ArrowDtype) and pa.types.is_null(keys.dtype.pyarrow_dtype)
+
+def needs_string_keys(left_keys: Keys, right_keys: Keys) -> bool:
+    """Check whether two merge key columns must be cast to a shared string dtype before joining."""
+    if left_keys.dtype == object or right_keys.dtype == object:
+        return True
+    if left_keys.dtype == right_keys.dtype:
+        return False
+    return not (pd.api.types.is_numeric_dtype(left_keys.dtype) and pd.api.types.is_numeric_dtype(right_keys.dtype))
+
+def as_string_keys(keys: Keys) -> Keys:
+    """Cast a merge key column to Arrow-backed strings so it hashes as contiguous buffers."""
+    if keys.dtype == object:
+        # Arrow cannot cast mixed Python objects directly
+        keys = keys.map(str, na_action='ignore')
+    return keys.astype(STRING_KEY_DTYPE)
+
+def encode_shared_keys(keys: List[pd.Index]) -> List[pd.CategoricalIndex]:
+    """Dictionary-encode string key indexes against one shared set of categories."""
+    arrays = [pa.array(idx, from_pandas=True, type=pa.string()) for idx in keys]
+    # One dictionary for every file; each index is looked up on its own so empty files keep their slot
+    dictionary = pc.drop_null(pc.unique(pa.chunked_array(arrays, type=pa.string())))
+    dtype = pd.CategoricalDtype(pd.Index(dictionary.to_pandas(types_mapper=pd.ArrowDtype)))
+    return [
+        pd.CategoricalIndex(
+            pd.Categorical.from_codes(pc.index_in(arr, value_set=dictionary).fill_null(-1).to_numpy(), dtype=dtype),
+            name=idx.name,
+        )
+        for idx, arr in zip(keys, arrays, strict=True)
+    ]
+
+def dense_key_codes(left_keys: Keys, right_keys: Keys) -> Optional[Tuple[np.ndarray, np.ndarray, int]]:
+    """Map both key columns onto shared non-negative int64 codes below the returned bound."""
+    if isinstance(left_keys.dtype, pd.CategoricalDtype) and left_keys.dtype == right_keys.dtype:
+        # Shift by one so missing keys (code -1) get a slot of their own
+        left_codes = np.asarray(left_keys.codes, dtype=np.int64) + 1
+        right_codes = np.asarray(right_keys.codes, dtype=np.int64) + 1
+        return left_codes, right_codes, len(left_keys.dtype.categories) + 1
+    if pd.api.types.is_numeric_dtype(left_keys.dtype) and pd.api.types.is_numeric_dtype(right_keys.dtype):
+        codes, uniques = pd.factorize(pd.Index(left_keys).append(pd.Index(right_keys)), use_na_sentinel=False)
+        codes = codes.astype(np.int64, copy=False)
+        return codes[:len(left_keys)], codes[len(left_keys):], len(uniques)
+    return None
+
+def count_key_differences(left_keys: Keys, right_keys: Keys) -> Tuple[int, int, int]:
+    """Count distinct keys only on the right (new), only on the left (missing) and on both sides (shared)."""
+    if HAS_NUMBA and len(left_keys) + len(right_keys) >= NUMBA_MIN_KEYS:
+        dense = dense_key_codes(left_keys, right_keys)
+        if dense is not None:
+            new_rows, missing_rows, shared_keys = _count_code_differences(*dense)
+            return int(new_rows), int(missing_rows), int(shared_keys)
+
+    if isinstance(left_keys.dtype, pd.CategoricalDtype) and left_keys.dtype == right_keys.dtype:
+        # Shared categories: the integer codes identify keys on both sides
+        left_keys, right_keys = pd.Series(left_keys.codes), pd.Series(right_keys.codes)
+    try:
+        left_unique = pc.unique(pa.array(left_keys, from_pandas=True))
+        right_unique = pc.unique(pa.array(right_keys, from_pandas=True))
+        new_rows = pc.sum(pc.invert(pc.is_in(right_unique, value_set=left_unique)), min_count=0)
+        missing_rows = pc.sum(pc.invert(pc.is_in(left_unique, value_set=right_unique)), min_count=0)
+        return new_rows.as_py(), missing_rows.as_py(), len(left_unique) - missing_rows.as_py()
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # Mixed or incompatible key types have no common Arrow type; compare as Python objects
+        left_set, right_set = set(left_keys), set(right_keys)
+        return len(right_set - left_set), len(left_set - right_set), len(left_set & right_set)
+
+def can_join_multiway(frames: List[pd.DataFrame]) -> bool:
+    """Check whether frames can be outer-joined in one aligned concat (shared key dtype, unique keys, distinct labels)."""
+    key_dtype = frames[0].index.dtype
+    labels = [col for df in frames for col in df.columns]
+    return (
+        all(df.index.dtype == key_dtype and df.index.is_unique for df in frames)
+        and len(set(labels)) == len(labels)
+    )
+
+def multiway_outer_join(frames: List[pd.DataFrame], merge_stats: Optional[Dict] = None) -> pd.DataFrame:
+    """Outer-join frames on their unique key indexes in a single multiway alignment."""
+    if merge_stats is not None:
+        # An outer join keeps every key seen so far, so each file is compared with their union
+        seen_keys = frames[0].index
+        for i, df in enumerate(frames[1:], 1):
+            new_rows, missing_rows, _ = count_key_differences(seen_keys, df.index)
+            merge_stats['new_rows_per_file'][i] = new_rows
+            merge_stats['missing_rows_per_file'][i] = missing_rows
+            seen_keys = seen_keys.union(df.index, sort=False)
+
+    result = pd.concat(frames, axis=1, join='outer', sort=False)
+    if not isinstance(result.index.dtype, pd.CategoricalDtype):
+        # The concat keeps first-seen key order; pairwise outer joins sort these keys
+        result = result.sort_index()
+    return result
+
+def merge_dataframes(dfs: List[pd.DataFrame], merge_columns: Dict[str, str], selected_columns: Dict[str, Set[str]], df_names: List[str], merge_type: str = 'outer', compute_stats: bool = False) -> Tuple[pd.DataFrame, Dict]:
     """Merge multiple DataFrames based on specified column mappings."""
     if not dfs or len(dfs) < 2:
         raise ValueError("At least two DataFrames are required for merging")
 
+    # Every file's merge column is labelled with the first file's key so the joins line up
+    key = merge_columns["df0"]
+
     # Filter DataFrames to keep only selected columns and rename for clarity
     filtered_dfs = []
     for i, (df, name) in enumerate(zip(dfs, df_names)):
@@ -26,72 +280,143 @@ def merge_dataframes(dfs: List[pd.DataFrame], merge_columns: Dict[str, str], sel
         merge_col = merge_columns[f"df{i}"]
         selected_cols = selected_columns.get(f"df{i}", set())
 
-        # Ensure merge column is included even if not selected
-        cols_to_keep = list(selected_cols | {merge_col})
+        # Ensure merge column is included even if not selected; keep the file's column order
+        cols_to_keep = [col for col in df.columns if col in selected_cols or col == merge_col]
 
-        # Create a copy of the DataFrame with selected columns
-        filtered_df = df[cols_to_keep].copy()
+        # Output labels include the file name (except the merge column, which takes the shared key)
+        prefix = sys.intern(os.path.splitext(name)[0] + "_")
+        labels = [
+            key if col == merge_col else f"{prefix}{col}"
+            for col in cols_to_keep
+        ]
 
-        # Rename columns to include file name (except merge column)
-        rename_dict = {
-            col: f"{name.split('.')[0]}_{col}" 
-            for col in filtered_df.columns 
-            if col != merge_col
-        }
-        filtered_df.rename(columns=rename_dict, inplace=True)
-        filtered_dfs.append(filtered_df)
+        # Project and relabel in one step; copy-on-write keeps this a view of the input.
+        # The key becomes the index so each merge is an index join with nothing to drop afterwards.
+        filtered_dfs.append(df.loc[:, cols_to_keep].set_axis(labels, axis=1).set_index(key))
+
+    try:
+        # Keys of different kinds (e.g. numeric ids vs text ids) are compared as Arrow strings
+        key_indexes = [df.index for df in filtered_dfs]
+        # Untyped keys (e.g. from a header-only CSV) hold no values, so they take the other files' key dtype
+        key_dtype = next((idx.dtype for idx in key_indexes if not is_null_keys(idx)), None)
+        if key_dtype is not None:
+            key_indexes = [idx.astype(key_dtype) if is_null_keys(idx) else idx for idx in key_indexes]
+        if any(needs_string_keys(key_indexes[0], idx) for idx in key_indexes[1:]):
+            key_indexes = [as_string_keys(idx) for idx in key_indexes]
+
+        # String keys share one categorical dtype so every join hashes integer codes
+        encode_keys = all(idx.dtype == STRING_KEY_DTYPE for idx in key_indexes)
+        if encode_keys:
+            key_indexes = encode_shared_keys(key_indexes)
+        filtered_dfs = [df.set_axis(idx, axis=0) for df, idx in zip(filtered_dfs, key_indexes, strict=True)]
+        del key_indexes
+    except Exception as e:
+        raise ValueError(f"Error merging DataFrames: {str(e)}")
 
-    result = filtered_dfs[0]
     merge_stats = {
         'total_rows_original': sum(len(df) for df in dfs),
         'new_rows_per_file': {},
         'missing_rows_per_file': {}
     }
 
-    for i, df in enumerate(filtered_dfs[1:], 1):
-        left_col = merge_columns[f"df0"]
-        right_col = merge_columns[f"df{i}"]
-
+    if merge_type == 'outer' and len(filtered_dfs) >= 3 and can_join_multiway(filtered_dfs):
+        # One aligned concat replaces the pairwise joins and their ever-wider intermediates
         try:
-            # Count unique values before merge
-            left_keys = set(result[left_col])
-            right_keys = set(df[right_col])
+            result = multiway_outer_join(filtered_dfs, merge_stats if compute_stats else None)
+        except Exception as e:
+            raise ValueError(f"Error merging DataFrames: {str(e)}")
+        del filtered_dfs
+    else:
+        # Each prepared frame is handed over to the loop below and released once it has been joined
+        result, filtered_dfs[0] = filtered_dfs[0], None
 
-            # Calculate new and missing rows
-            new_rows = len(right_keys - left_keys)
-            missing_rows = len(left_keys - right_keys)
+        for i in range(1, len(filtered_dfs)):
+            df, filtered_dfs[i] = filtered_dfs[i], None
+            try:
+                # Key statistics cost an extra pass over both key columns, so they are opt-in
+                shared_keys = None
+                if compute_stats:
+                    # Calculate new and missing rows from the distinct keys on each side
+                    new_rows, missing_rows, shared_keys = count_key_differences(result.index, df.index)
 
-            merge_stats['new_rows_per_file'][i] = new_rows
-            merge_stats['missing_rows_per_file'][i] = missing_rows
+                    merge_stats['new_rows_per_file'][i] = new_rows
+                    merge_stats['missing_rows_per_file'][i] = missing_rows
 
-            # Perform merge
-            result = result.merge(
-                df,
-                left_on=left_col,
-                right_on=right_col,
-                how=merge_type
-            )
+                if shared_keys == 0 and merge_type == 'inner':
+                    # Disjoint keys: the inner join is empty, so only its columns need building
+                    result = result.iloc[0:0].join(df.iloc[0:0], how='inner', lsuffix='_x', rsuffix='_y')
+                else:
+                    # Perform merge as an unsorted index join; suffixes match DataFrame.merge defaults
+                    result = result.join(df, how=merge_type, sort=False, lsuffix='_x', rsuffix='_y')
 
-            # If merge columns have different names, drop the duplicate
-            if left_col != right_col:
-                result = result.drop(right_col, axis=1)
+            except Exception as e:
+                raise ValueError(f"Error merging DataFrames: {str(e)}")
 
-        except Exception as e:
-            raise ValueError(f"Error merging DataFrames: {str(e)}")
+            # Free the joined input and the previous result before the next, wider join
+            del df
+            gc.collect()
 
+    if encode_keys:
+        result = result.set_axis(result.index.astype(STRING_KEY_DTYPE), axis=0)
+        if merge_type == 'outer':
+            # Categorical joins keep first-seen order; sort so string keys come out ordered like numeric ones
+            result = result.sort_index()
+    result = result.reset_index()
     merge_stats['total_rows_merged'] = len(result)
     return result, merge_stats
 
+EXCEL_MAX_ROWS = 1_048_576
+EXCEL_MAX_COLS = 16_384
+XLSX_CHUNK_ROWS = 10_000
+
+def write_xlsx(df: pd.DataFrame, buffer) -> None:
+    """Stream DataFrame rows into an .xlsx workbook using xlsxwriter's constant-memory mode."""
+    if len(df) + 1 > EXCEL_MAX_ROWS or len(df.columns) > EXCEL_MAX_COLS:
+        raise ValueError(
+            f"This sheet is too large! Your sheet size is: {len(df) + 1}, {len(df.columns)} "
+            f"Max sheet size is: {EXCEL_MAX_ROWS}, {EXCEL_MAX_COLS}"
+        )
+
+    workbook = xlsxwriter.Workbook(buffer, {
+        "constant_memory": True,
+        "use_zip64": True,
+        "nan_inf_to_errors": True,
+        "strings_to_urls": False,
+        "remove_timezone": True,
+        "default_date_format": "yyyy-mm-dd hh:mm:ss",
+    })
+    worksheet = workbook.add_worksheet("merged")
+    header_format = workbook.add_format({"bold": True, "border": 1, "align": "center"})
+
+    # constant_memory flushes each row once the next one starts, so cells must be written row by row
+    worksheet.write_row(0, 0, [str(col) for col in df.columns], header_format)
+    for start in range(0, len(df), XLSX_CHUNK_ROWS):
+        chunk = df.iloc[start:start + XLSX_CHUNK_ROWS]
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for offset, row in enumerate(chunk.itertuples(index=False, name=None), start + 1):
+            worksheet.write_row(offset, 0, row)
+
+    workbook.close()
+
 def get_download_buffer(df: pd.DataFrame, file_format: str) -> Tuple[io.BytesIO, str]:
     """Prepare DataFrame for download in specified format."""
     buffer = io.BytesIO()
 
     if file_format == 'csv':
-        df.to_csv(buffer, index=False)
+        df.to_csv(buffer, index=False, lineterminator="\n", chunksize=200_000)
         mime = 'text/csv'
+    elif file_format in ('parquet', 'feather'):
+        # Arrow formats need string column labels and a default index
+        df = df.rename(columns=str).reset_index(drop=True)
+        if file_format == 'parquet':
+            df.to_parquet(buffer, engine="pyarrow", compression="zstd", compression_level=3, index=False)
+            mime = 'application/vnd.apache.parquet'
+        else:
+            df.to_feather(buffer, compression="zstd")
+            mime = 'application/vnd.apache.arrow.file'
     else:  # Excel
-        df.to_excel(buffer, index=False)
+        write_xlsx(df, buffer)
         mime = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 
     buffer.seek(0)
-    return buffer, mime
\ No newline at end of file
+    return buffer, mime